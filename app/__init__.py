@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# Load .env once, before any app module reads the environment
+load_dotenv()
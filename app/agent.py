@@ -6,8 +6,6 @@ from .tools import (
     analyze_sales_data,
     generate_deep_research_report,
 )
-from dotenv import load_dotenv
-load_dotenv()
 
 # Initialize Tools
 image_tool = ImageGenerationTool(
@@ -15,9 +13,15 @@ image_tool = ImageGenerationTool(
 )
 search_tool = WebSearchTool()  # Real web search via Responses API
 
-my_agent = Agent(
-    name="ProAssistant",
-    instructions="""
+# WOFF2 sources the agent may use when proposing font pairings
+FONT_SOURCES: dict[str, str] = {
+    "Lora": "https://fonts.gstatic.com/s/lora/v37/0QIvMX1D_JOuMwr7I_FMl_E.woff2",
+    "Inter": "https://rsms.me/inter/font-files/Inter-Regular.woff2",
+    "JetBrains Mono": "https://fonts.gstatic.com/s/jetbrainsmono/v23/tDbV2o-flEEny0FZhsfKu5WU4xD1OwGtT0rU3BE.woff2",
+    "OpenAI Sans": "https://cdn.openai.com/common/fonts/openai-sans/v2/OpenAISans-Regular.woff2",
+}
+
+_INSTRUCTIONS_TEMPLATE = """
     You are an advanced assistant with various capabilities.
     
     1. WEB SEARCH:
@@ -31,10 +35,7 @@ my_agent = Agent(
        - If the user asks to create a theme, use 'preview_theme' to generate a preview.
        - When customizing themes, propose high-quality font pairings.
        - Use these WOFF2 URLs:
-          * Lora: https://fonts.gstatic.com/s/lora/v37/0QIvMX1D_JOuMwr7I_FMl_E.woff2
-          * Inter: https://rsms.me/inter/font-files/Inter-Regular.woff2
-          * JetBrains Mono: https://fonts.gstatic.com/s/jetbrainsmono/v23/tDbV2o-flEEny0FZhsfKu5WU4xD1OwGtT0rU3BE.woff2
-          * OpenAI Sans: https://cdn.openai.com/common/fonts/openai-sans/v2/OpenAISans-Regular.woff2
+{fonts}
       
     4. DATA ANALYSIS:
        - If the user asks for sales, revenue, or performance data, use 'analyze_sales_data'.
@@ -48,7 +49,15 @@ my_agent = Agent(
     
     7. WEATHER INFORMATION:
        - If the user asks about weather, use 'get_weather' to provide current conditions and forecasts.
-    """,
+    """
+
+INSTRUCTIONS = _INSTRUCTIONS_TEMPLATE.format(
+    fonts="\n".join(f"          * {name}: {url}" for name, url in FONT_SOURCES.items())
+)
+
+my_agent = Agent(
+    name="ProAssistant",
+    instructions=INSTRUCTIONS,
     model="gpt-5-mini",
     tools=[
         search_tool,
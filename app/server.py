@@ -1,17 +1,23 @@
-import io
+import json
+import codecs
 import base64
 import asyncio
+import dataclasses
 import aiofiles
 from pathlib import Path
-from typing import AsyncIterator, Any, List
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import AsyncIterator, Any, Sequence
 from datetime import datetime
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, Timeout
 from openai.types.responses import ResponseInputTextParam, ResponseInputImageParam
+from pydantic import BaseModel
 import os
 
 from chatkit.server import ChatKitServer
 from chatkit.types import (
     ThreadMetadata,
+    ThreadItem,
     UserMessageItem,
     ThreadStreamEvent,
     AssistantMessageItem,
@@ -36,35 +42,190 @@ from chatkit.agents import (
     ResponseStreamConverter,
     simple_to_agent_input,
 )
-from agents import Runner
+from agents import Runner, TResponseInputItem, set_default_openai_client
 
 from .types import RequestContext
 from .agent import my_agent
-from .tools import MOCK_ENTITIES
+from .tools import MOCK_ENTITY_BLOCKS
+
+# One pooled client for the agent runner, titles and transcription, so small
+# follow-up calls reuse warm keep-alive connections instead of new TLS handshakes.
+# The SDK's default http client already pools connections; only fail fast on connect.
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    timeout=Timeout(600.0, connect=5.0),
+)
+set_default_openai_client(client)
+UPLOAD_DIR = Path("uploads")
+
+# Converted attachment payloads keyed on "id:mtime_ns:size", so history
+# replays don't re-read and re-encode the same upload every turn.
+ATTACHMENT_CACHE_SIZE = 256
+# ...and by total payload size, so a few large images can't pin hundreds of MB
+ATTACHMENT_CACHE_BYTES = 32 * 1024 * 1024
+# Image reads are encoded in chunks; a multiple of 3 so no bytes carry over
+B64_CHUNK_SIZE = 48 * 1024
+# Text attachments above this are summarized instead of inlined into the prompt
+MAX_TEXT_BYTES = 512 * 1024
+# Leading bytes inspected to reject binary files before decoding all of them
+SNIFF_BYTES = 4096
+_BINARY_SIGNATURES = (
+    b"\x89PNG",
+    b"\xff\xd8",
+    b"GIF8",
+    b"%PDF",
+    # ZIP local file / empty archive / spanned archive headers (also docx, xlsx, jar)
+    b"PK\x03\x04",
+    b"PK\x05\x06",
+    b"PK\x07\x08",
+)
+_attachment_cache: OrderedDict[
+    str, ResponseInputTextParam | ResponseInputImageParam
+] = OrderedDict()
+_attachment_cache_bytes = 0
+# Attachments already converted by the current to_agent_input call, by id. The
+# converter is shared across requests, so this is scoped to the calling task.
+_prefetched_attachments: ContextVar[
+    dict[str, ResponseInputTextParam | ResponseInputImageParam] | None
+] = ContextVar("prefetched_attachments", default=None)
+
+# Background thread-title calls: keep references so tasks aren't GC'd
+# mid-flight, and cap how many hit the API at once.
+_title_semaphore = asyncio.Semaphore(8)
+_bg_tasks: set[asyncio.Task] = set()
+
+
+# Structured output for title calls: the reply is always {"title": "..."}
+_TITLE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "thread_title",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"title": {"type": "string"}},
+            "required": ["title"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+async def _generate_title(text: str) -> str:
+    # One call per title, bounded by the semaphore. Titles are deliberately not
+    # batched across threads: a shared prompt would mix different users' messages.
+    async with _title_semaphore:
+        res = await client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "Summarize the text into a 3-word title."},
+                {"role": "user", "content": text},
+            ],
+            response_format=_TITLE_FORMAT,
+        )
+    return json.loads(res.choices[0].message.content)["title"]
+
+
+def _looks_binary(head: bytes) -> bool:
+    if head.startswith(_BINARY_SIGNATURES) or b"\x00" in head:
+        return True
+    try:
+        # Not final: the sniff may cut a multi-byte character in half
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def upload_filename(file_id: str, name: str) -> str:
+    """Name an upload is stored under in UPLOAD_DIR: <attachment id><original extension>."""
+    return f"{file_id}{os.path.splitext(name)[1]}"
+
+
+def _payload_size(content: ResponseInputTextParam | ResponseInputImageParam) -> int:
+    return len(content.get("image_url") or content.get("text") or "")
+
+
+def _cache_attachment(
+    key: str, content: ResponseInputTextParam | ResponseInputImageParam
+) -> None:
+    global _attachment_cache_bytes
+    size = _payload_size(content)
+    if size > ATTACHMENT_CACHE_BYTES // 4:
+        # Too big to be worth holding; re-read it next time
+        return
+    if (old := _attachment_cache.pop(key, None)) is not None:
+        _attachment_cache_bytes -= _payload_size(old)
+    _attachment_cache[key] = content
+    _attachment_cache_bytes += size
+    while (
+        len(_attachment_cache) > ATTACHMENT_CACHE_SIZE
+        or _attachment_cache_bytes > ATTACHMENT_CACHE_BYTES
+    ):
+        _, evicted = _attachment_cache.popitem(last=False)
+        _attachment_cache_bytes -= _payload_size(evicted)
 
-from dotenv import load_dotenv
 
-load_dotenv()
+def _upload_path(attachment) -> Path:
+    return UPLOAD_DIR / upload_filename(attachment.id, attachment.name)
 
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-UPLOAD_DIR = Path("uploads")
+
+async def _read_data_url(file_path: Path, size: int, mime_type: str) -> str:
+    """Read a file into a base64 data: URL, encoding chunk by chunk into one buffer."""
+    prefix = f"data:{mime_type};base64,".encode("ascii")
+    buf = bytearray(len(prefix) + ((size + 2) // 3) * 4)
+    buf[: len(prefix)] = prefix
+    pos = len(prefix)
+    async with aiofiles.open(file_path, "rb") as f:
+        while chunk := await f.read(B64_CHUNK_SIZE):
+            encoded = base64.b64encode(chunk)
+            buf[pos : pos + len(encoded)] = encoded
+            pos += len(encoded)
+    del buf[pos:]  # file shrank since stat()
+    return buf.decode("ascii")
 
 
 class LocalConverter(ThreadItemConverter):
+    async def to_agent_input(
+        self, thread_items: Sequence[ThreadItem] | ThreadItem
+    ) -> list[TResponseInputItem]:
+        # Convert items concurrently so attachment reads overlap; gather keeps order.
+        if not isinstance(thread_items, Sequence):
+            thread_items = [thread_items]
+        thread_items = list(thread_items)
+        # user_message_to_input awaits a message's attachments one by one, so
+        # load them all up front and hand the results to the per-item pass directly
+        # (the LRU is bounded and may skip or evict large payloads in between).
+        attachments = [
+            attachment
+            for item in thread_items
+            if isinstance(item, UserMessageItem)
+            for attachment in item.attachments
+        ]
+        contents = await asyncio.gather(
+            *(self.attachment_to_message_content(a) for a in attachments)
+        )
+        token = _prefetched_attachments.set(
+            {a.id: content for a, content in zip(attachments, contents)}
+        )
+        try:
+            converted = await asyncio.gather(
+                *(
+                    self._thread_item_to_input_item(
+                        item, is_last_message=item is thread_items[-1]
+                    )
+                    for item in thread_items
+                )
+            )
+        finally:
+            _prefetched_attachments.reset(token)
+        return [input_item for items in converted for input_item in items]
+
     async def tag_to_message_content(
         self, tag: UserMessageTagContent
     ) -> ResponseInputTextParam:
-        entity_id = tag.id
-        entity_data = MOCK_ENTITIES.get(entity_id)
-
-        if entity_data:
-            context_block = (
-                f"<ORDER_CONTEXT id='{entity_id}'>\n"
-                f"  Title: {entity_data.get('title')}\n"
-                f"  Status: {entity_data.get('status')}\n"
-                f"  Items: {', '.join(entity_data.get('items', []))}\n"
-                f"</ORDER_CONTEXT>"
-            )
+        context_block = MOCK_ENTITY_BLOCKS.get(tag.id)
+        if context_block:
             return ResponseInputTextParam(
                 type="input_text", text=f"\n[User tagged an entity]\n{context_block}\n"
             )
@@ -74,33 +235,55 @@ class LocalConverter(ThreadItemConverter):
         )
 
     async def attachment_to_message_content(self, attachment):
-        file_path = next(
-            (f for f in UPLOAD_DIR.iterdir() if f.stem == attachment.id), None
-        )
-        if not file_path:
+        prefetched = _prefetched_attachments.get()
+        if prefetched and (content := prefetched.get(attachment.id)) is not None:
+            return content
+
+        file_path = _upload_path(attachment)
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
             return ResponseInputTextParam(type="input_text", text="[File not found]")
 
-        async with aiofiles.open(file_path, "rb") as f:
-            file_bytes = await f.read()
+        key = f"{attachment.id}:{stat.st_mtime_ns}:{stat.st_size}"
+        if (cached := _attachment_cache.get(key)) is not None:
+            _attachment_cache.move_to_end(key)
+            return cached
+
+        content = await self._read_attachment(attachment, file_path, stat.st_size)
+        _cache_attachment(key, content)
+        return content
 
+    async def _read_attachment(self, attachment, file_path: Path, size: int):
         if isinstance(attachment, ImageAttachment) or attachment.mime_type.startswith(
             "image/"
         ):
-            b64 = base64.b64encode(file_bytes).decode("utf-8")
             return ResponseInputImageParam(
                 type="input_image",
                 detail="auto",
-                image_url=f"data:{attachment.mime_type};base64,{b64}",
+                image_url=await _read_data_url(file_path, size, attachment.mime_type),
             )
-        try:
+
+        if size > MAX_TEXT_BYTES:
             return ResponseInputTextParam(
                 type="input_text",
-                text=f"\n[File {attachment.name}]:\n{file_bytes.decode('utf-8')}\n",
-            )
-        except:
-            return ResponseInputTextParam(
-                type="input_text", text=f"[Binary file {attachment.name}]"
+                text=f"[File {attachment.name} too large to include ({size} bytes)]",
             )
+        binary = ResponseInputTextParam(
+            type="input_text", text=f"[Binary file {attachment.name}]"
+        )
+        async with aiofiles.open(file_path, "rb") as f:
+            head = await f.read(SNIFF_BYTES)
+            if _looks_binary(head):
+                return binary
+            file_bytes = head + await f.read()
+        try:
+            text = file_bytes.decode("utf-8")
+        except UnicodeDecodeError:
+            return binary
+        return ResponseInputTextParam(
+            type="input_text", text=f"\n[File {attachment.name}]:\n{text}\n"
+        )
 
 
 class LocalResponseConverter(ResponseStreamConverter):
@@ -119,8 +302,23 @@ class LocalResponseConverter(ResponseStreamConverter):
         )
 
 
+# Both converters are stateless, so one instance serves every request
+_converter = LocalConverter()
+_response_converter = LocalResponseConverter(partial_images=3)
+
+
 class MyChatKitServer(ChatKitServer[RequestContext]):
 
+    def _serialize(self, obj: BaseModel) -> bytes:
+        # Every SSE event passes through here; serialize straight to bytes
+        # instead of model_dump_json() -> str -> .encode().
+        return obj.__pydantic_serializer__.to_json(
+            obj,
+            by_alias=True,
+            exclude_none=True,
+            context={"exclude_metadata": True},
+        )
+
     async def respond(
         self,
         thread: ThreadMetadata,
@@ -133,26 +331,31 @@ class MyChatKitServer(ChatKitServer[RequestContext]):
         last_response_id = thread.metadata.get("last_response_id")
 
         # 2. If we have a stateful ID, we only need to send the NEW message.
-        # Otherwise (first message), we send the history.
+        # Otherwise (first message, or a retry without input), we send the history.
         if last_response_id and input_message:
-            converter = LocalConverter()
-            agent_inputs = await converter.to_agent_input([input_message])
+            agent_inputs = await _converter.to_agent_input([input_message])
         else:
+            # Newest-first page of the latest window; flip it in place to chronological
             items_page = await self.store.load_thread_items(
                 thread.id, None, 15, "desc", context
             )
-            items = list(reversed(items_page.data))
-            converter = LocalConverter()
-            agent_inputs = await converter.to_agent_input(items)
+            items_page.data.reverse()
+            agent_inputs = await _converter.to_agent_input(items_page.data)
 
-        # 3. Handle Model Switching / Tool Forcing
+        # 3. Handle Model Switching / Tool Forcing on a per-request clone,
+        # so concurrent threads never see each other's overrides.
+        agent = my_agent
         if input_message and input_message.inference_options:
-            if input_message.inference_options.model:
-                my_agent.model = input_message.inference_options.model
-            if input_message.inference_options.tool_choice:
-                my_agent.model_settings.tool_choice = (
-                    input_message.inference_options.tool_choice.id
+            options = input_message.inference_options
+            overrides = {}
+            if options.model:
+                overrides["model"] = options.model
+            if options.tool_choice:
+                overrides["model_settings"] = dataclasses.replace(
+                    my_agent.model_settings, tool_choice=options.tool_choice.id
                 )
+            if overrides:
+                agent = my_agent.clone(**overrides)
 
         agent_context = AgentContext(
             thread=thread, store=self.store, request_context=context
@@ -161,7 +364,7 @@ class MyChatKitServer(ChatKitServer[RequestContext]):
         # 4. Use the Responses API specialized runner
         # auto_previous_response_id ensures the SDK handles the chaining for us.
         result = Runner.run_streamed(
-            my_agent,
+            agent,
             agent_inputs,
             context=agent_context,
             previous_response_id=last_response_id,
@@ -169,14 +372,10 @@ class MyChatKitServer(ChatKitServer[RequestContext]):
         )
 
         async for event in stream_agent_response(
-            agent_context, result, converter=LocalResponseConverter(partial_images=3)
+            agent_context, result, converter=_response_converter
         ):
             yield event
 
-        # Reset tool choice after response
-        my_agent.model_settings.tool_choice = None
-        my_agent.reset_tool_choice = True
-
         # 5. Performance: Capture and persist the new response ID for the next turn
         if result.last_response_id:
             thread.metadata["last_response_id"] = result.last_response_id
@@ -184,9 +383,11 @@ class MyChatKitServer(ChatKitServer[RequestContext]):
 
         # Auto-title generation (non-blocking)
         if not thread.title and input_message:
-            asyncio.create_task(
-                self._generate_thread_title(thread, [input_message], context)
+            task = asyncio.create_task(
+                self._generate_thread_title(thread, input_message, context)
             )
+            _bg_tasks.add(task)
+            task.add_done_callback(_bg_tasks.discard)
 
     async def action(
         self,
@@ -222,39 +423,46 @@ class MyChatKitServer(ChatKitServer[RequestContext]):
             )
 
     async def _generate_thread_title(
-        self, thread: ThreadMetadata, items: List[Any], context: RequestContext
+        self,
+        thread: ThreadMetadata,
+        input_message: UserMessageItem,
+        context: RequestContext,
     ):
+        if thread.title:
+            return
         try:
-            first_text = "New Conversation"
-            for item in items:
-                if isinstance(item, UserMessageItem):
-                    for part in item.content:
-                        if isinstance(part, UserMessageTextContent):
-                            first_text = part.text
-                            break
-                    break
-
-            res = await client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Summarize into a 3-word title. Text only.",
-                    },
-                    {"role": "user", "content": first_text},
-                ],
+            first_text = next(
+                (
+                    part.text
+                    for part in input_message.content
+                    if isinstance(part, UserMessageTextContent)
+                ),
+                "New Conversation",
             )
-            thread.title = res.choices[0].message.content.strip().replace('"', "")
+
+            # Nothing to summarize (e.g. attachment-only message); a later
+            # turn with text can still title the thread.
+            if first_text == "New Conversation":
+                return
+
+            # Too short to be worth summarizing ("hi", "thanks"): use as-is
+            if len(first_text.split()) < 3:
+                thread.title = first_text.strip()[:40]
+                await self.store.save_thread(thread, context)
+                return
+
+            title = await _generate_title(first_text)
+            thread.title = title.strip()
             await self.store.save_thread(thread, context)
-        except:
+        except Exception:
             pass
 
     async def transcribe(
         self, audio_input: AudioInput, context: RequestContext
     ) -> TranscriptionResult:
-        f = io.BytesIO(audio_input.data)
-        f.name = "voice.webm"
+        # (filename, bytes, content type) lets the SDK post the buffer as-is
         transcription = await client.audio.transcriptions.create(
-            model="gpt-4o-mini-transcribe", file=f
+            model="gpt-4o-mini-transcribe",
+            file=("voice.webm", audio_input.data, audio_input.media_type),
         )
         return TranscriptionResult(text=transcription.text)
\ No newline at end of file
@@ -1,4 +1,5 @@
 import json
+import asyncio
 import aiosqlite
 from datetime import datetime
 from typing import Any
@@ -12,20 +13,106 @@ from .types import RequestContext
 
 DB_PATH = "chatkit.db"
 
+# Building a TypeAdapter compiles a validator; do it once, not per query.
+# Writes use their dump_json(), which hands aiosqlite bytes straight from
+# pydantic-core instead of decoding to str first like model_dump_json().
+# The INSERTs CAST those bytes AS TEXT so the data columns keep one storage
+# type (a BLOB would be read as JSONB by SQLite's json_* functions).
+THREAD_ADAPTER = TypeAdapter(ThreadMetadata)
+THREAD_ITEM_ADAPTER = TypeAdapter(ThreadItem)
+ATTACHMENT_ADAPTER = TypeAdapter(Attachment)
+
+# Max queued writes folded into one transaction by the writer task
+WRITE_BATCH_SIZE = 50
+
 class SQLiteStore(Store[RequestContext], AttachmentStore[RequestContext]):
     def __init__(self):
         self.db = None
+        self._writes: asyncio.Queue | None = None
+        self._writer: asyncio.Task | None = None
+        self._closed = False
 
     async def connect(self):
-        self.db = await aiosqlite.connect(DB_PATH)
+        # Every query is a fixed literal, so a larger statement cache keeps them all prepared
+        self.db = await aiosqlite.connect(DB_PATH, cached_statements=256)
         # Enable WAL mode for better concurrency performance
         await self.db.execute("PRAGMA journal_mode=WAL;")
+        # With WAL, NORMAL only syncs at checkpoints and stays corruption-safe
+        await self.db.execute("PRAGMA synchronous=NORMAL;")
+        # ~20 MB page cache, in-memory temp tables, 256 MB memory-mapped reads
+        await self.db.execute("PRAGMA cache_size=-20000;")
+        await self.db.execute("PRAGMA temp_store=MEMORY;")
+        await self.db.execute("PRAGMA mmap_size=268435456;")
+        # SQLite ignores FOREIGN KEY clauses unless enabled per connection;
+        # delete_thread relies on ON DELETE CASCADE to clear the thread's items
+        await self.db.execute("PRAGMA foreign_keys = ON;")
         await self._init_db()
+        # Refresh planner stats for the pagination indexes where they're stale
+        await self.db.execute("PRAGMA optimize=0x10002;")
+        self._writes = asyncio.Queue()
+        self._writer = asyncio.create_task(self._run_writer())
 
     async def close(self):
+        # Refuse new writes first: nothing reads the queue once the writer exits
+        self._closed = True
+        if self._writer:
+            # Let queued writes land before closing the connection
+            await self._writes.put(None)
+            await self._writer
         if self.db:
+            await self.db.execute("PRAGMA optimize;")
             await self.db.close()
 
+    # --- Write Batching ---
+
+    async def _write(self, *statements: tuple[str, tuple]) -> None:
+        """Queue statements to run atomically and wait until they are committed."""
+        if self._closed or self._writes is None:
+            raise RuntimeError("Store is not connected")
+        future = asyncio.get_running_loop().create_future()
+        await self._writes.put((statements, future))
+        await future
+
+    async def _run_writer(self):
+        # Single writer: everything queued while the previous batch was committing
+        # goes into the next transaction, so bursts share one commit.
+        while (op := await self._writes.get()) is not None:
+            batch = [op]
+            while len(batch) < WRITE_BATCH_SIZE and not self._writes.empty():
+                if (op := self._writes.get_nowait()) is None:
+                    self._writes.put_nowait(None)
+                    break
+                batch.append(op)
+
+            try:
+                await self._commit(batch)
+            except Exception:
+                # Replay one write per transaction so only the failing one errors
+                for op in batch:
+                    try:
+                        await self._commit([op])
+                    except Exception as e:
+                        if not op[1].done():
+                            op[1].set_exception(e)
+                    else:
+                        if not op[1].done():
+                            op[1].set_result(None)
+            else:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+
+    async def _commit(self, batch: list) -> None:
+        await self.db.execute("BEGIN IMMEDIATE")
+        try:
+            for statements, _ in batch:
+                for sql, params in statements:
+                    await self.db.execute(sql, params)
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+
     async def _init_db(self):
         async with self.db.execute("BEGIN"):
             await self.db.execute("""
@@ -46,7 +133,10 @@ class SQLiteStore(Store[RequestContext], AttachmentStore[RequestContext]):
                     FOREIGN KEY(thread_id) REFERENCES threads(id) ON DELETE CASCADE
                 )
             """)
-            await self.db.execute("CREATE INDEX IF NOT EXISTS idx_items_thread ON items(thread_id);")
+            # Composite indexes back the keyset pagination in load_threads / load_thread_items
+            await self.db.execute("CREATE INDEX IF NOT EXISTS idx_threads_user_created ON threads(user_id, created_at, id);")
+            await self.db.execute("CREATE INDEX IF NOT EXISTS idx_items_thread_created ON items(thread_id, created_at, id);")
+            await self.db.execute("DROP INDEX IF EXISTS idx_items_thread;")
             await self.db.execute("""
                 CREATE TABLE IF NOT EXISTS attachments (
                     id TEXT PRIMARY KEY,
@@ -54,6 +144,9 @@ class SQLiteStore(Store[RequestContext], AttachmentStore[RequestContext]):
                     data TEXT NOT NULL
                 )
             """)
+            # Rows written as BLOBs before the CASTs above went in
+            for table in ("threads", "items", "attachments"):
+                await self.db.execute(f"UPDATE {table} SET data = CAST(data AS TEXT) WHERE typeof(data) = 'blob'")
             await self.db.commit()
 
     # --- Thread Operations ---
@@ -69,37 +162,49 @@ class SQLiteStore(Store[RequestContext], AttachmentStore[RequestContext]):
             return ThreadMetadata.model_validate_json(row[0])
 
     async def save_thread(self, thread: ThreadMetadata, context: RequestContext) -> None:
-        await self.db.execute(
-            "INSERT OR REPLACE INTO threads (id, user_id, created_at, data) VALUES (?, ?, ?, ?)",
-            (thread.id, context.user_id, thread.created_at.isoformat(), thread.model_dump_json())
-        )
-        await self.db.commit()
+        # Upsert rather than INSERT OR REPLACE: REPLACE deletes the old row first,
+        # which would cascade to every item in the thread
+        await self._write((
+            "INSERT INTO threads (id, user_id, created_at, data) VALUES (?, ?, ?, CAST(? AS TEXT)) "
+            "ON CONFLICT(id) DO UPDATE SET user_id = excluded.user_id, "
+            "created_at = excluded.created_at, data = excluded.data",
+            (thread.id, context.user_id, thread.created_at.isoformat(), THREAD_ADAPTER.dump_json(thread))
+        ))
 
-    async def load_threads(self, limit: int, after: str | None, order: str, context: RequestContext) -> Page[ThreadMetadata]:
-        # Simple pagination: Get all (optimized would use OFFSET/LIMIT in SQL)
-        query = "SELECT data FROM threads WHERE user_id = ? ORDER BY created_at DESC"
-        async with self.db.execute(query, (context.user_id,)) as cursor:
+    async def _load_page_rows(self, table: str, scope_column: str, scope_value: str, after: str | None, limit: int, order: str) -> tuple[list, bool]:
+        # Keyset pagination on (created_at, id): only limit + 1 rows are read and parsed.
+        # created_at is stored as an ISO string, which sorts chronologically.
+        op, direction = (">", "ASC") if order == "asc" else ("<", "DESC")
+        query = f"SELECT data FROM {table} WHERE {scope_column} = ?"
+        params: list[Any] = [scope_value]
+
+        if after:
+            async with self.db.execute(
+                f"SELECT created_at, id FROM {table} WHERE id = ? AND {scope_column} = ?",
+                (after, scope_value)
+            ) as cursor:
+                anchor = await cursor.fetchone()
+            if anchor:
+                query += f" AND (created_at, id) {op} (?, ?)"
+                params.extend(anchor)
+
+        query += f" ORDER BY created_at {direction}, id {direction} LIMIT ?"
+        params.append(limit + 1)
+        async with self.db.execute(query, params) as cursor:
             rows = await cursor.fetchall()
-            
+
+        return rows[:limit], len(rows) > limit
+
+    async def load_threads(self, limit: int, after: str | None, order: str, context: RequestContext) -> Page[ThreadMetadata]:
+        rows, has_more = await self._load_page_rows("threads", "user_id", context.user_id, after, limit, order)
         threads = [ThreadMetadata.model_validate_json(r[0]) for r in rows]
-        
-        start_idx = 0
-        if after:
-            for i, t in enumerate(threads):
-                if t.id == after:
-                    start_idx = i + 1
-                    break
-        
-        sliced = threads[start_idx : start_idx + limit]
-        has_more = (start_idx + limit) < len(threads)
-        new_after = sliced[-1].id if sliced and has_more else None
-        
-        return Page(data=sliced, has_more=has_more, after=new_after)
+        new_after = threads[-1].id if threads and has_more else None
+
+        return Page(data=threads, has_more=has_more, after=new_after)
 
     async def delete_thread(self, thread_id: str, context: RequestContext) -> None:
-        await self.db.execute("DELETE FROM threads WHERE id = ? AND user_id = ?", (thread_id, context.user_id))
-        await self.db.execute("DELETE FROM items WHERE thread_id = ? AND user_id = ?", (thread_id, context.user_id))
-        await self.db.commit()
+        # Items go with the thread via ON DELETE CASCADE
+        await self._write(("DELETE FROM threads WHERE id = ? AND user_id = ?", (thread_id, context.user_id)))
 
     # --- Item Operations ---
 
@@ -109,76 +214,51 @@ class SQLiteStore(Store[RequestContext], AttachmentStore[RequestContext]):
             if not await cursor.fetchone():
                 raise NotFoundError("Thread not found")
 
-        # Get items
-        async with self.db.execute(
-            "SELECT data FROM items WHERE thread_id = ? ORDER BY created_at ASC", 
-            (thread_id,)
-        ) as cursor:
-            rows = await cursor.fetchall()
-            
-        adapter = TypeAdapter(ThreadItem)
-        items = [adapter.validate_json(r[0]) for r in rows]
-        
-        if order == "desc":
-            items.reverse()
-
-        start_idx = 0
-        if after:
-            for i, item in enumerate(items):
-                if item.id == after:
-                    start_idx = i + 1
-                    break
-        
-        sliced = items[start_idx : start_idx + limit]
-        has_more = (start_idx + limit) < len(items)
-        new_after = sliced[-1].id if sliced and has_more else None
+        rows, has_more = await self._load_page_rows("items", "thread_id", thread_id, after, limit, order)
+        items = [THREAD_ITEM_ADAPTER.validate_json(r[0]) for r in rows]
+        new_after = items[-1].id if items and has_more else None
 
-        return Page(data=sliced, has_more=has_more, after=new_after)
+        return Page(data=items, has_more=has_more, after=new_after)
 
     async def add_thread_item(self, thread_id: str, item: ThreadItem, context: RequestContext) -> None:
-        await self.db.execute(
-            "INSERT INTO items (id, thread_id, user_id, created_at, data) VALUES (?, ?, ?, ?, ?)",
-            (item.id, thread_id, context.user_id, item.created_at.isoformat(), item.model_dump_json())
-        )
-        await self.db.commit()
+        await self._write((
+            "INSERT INTO items (id, thread_id, user_id, created_at, data) VALUES (?, ?, ?, ?, CAST(? AS TEXT))",
+            (item.id, thread_id, context.user_id, item.created_at.isoformat(), THREAD_ITEM_ADAPTER.dump_json(item))
+        ))
 
     async def save_item(self, thread_id: str, item: ThreadItem, context: RequestContext) -> None:
-        await self.db.execute(
-            "INSERT OR REPLACE INTO items (id, thread_id, user_id, created_at, data) VALUES (?, ?, ?, ?, ?)",
-            (item.id, thread_id, context.user_id, item.created_at.isoformat(), item.model_dump_json())
-        )
-        await self.db.commit()
+        await self._write((
+            "INSERT OR REPLACE INTO items (id, thread_id, user_id, created_at, data) VALUES (?, ?, ?, ?, CAST(? AS TEXT))",
+            (item.id, thread_id, context.user_id, item.created_at.isoformat(), THREAD_ITEM_ADAPTER.dump_json(item))
+        ))
 
     async def load_item(self, thread_id: str, item_id: str, context: RequestContext) -> ThreadItem:
         async with self.db.execute("SELECT data FROM items WHERE id = ? AND thread_id = ?", (item_id, thread_id)) as cursor:
             row = await cursor.fetchone()
             if not row:
                 raise NotFoundError(f"Item {item_id} not found")
-            return TypeAdapter(ThreadItem).validate_json(row[0])
+            return THREAD_ITEM_ADAPTER.validate_json(row[0])
 
     async def delete_thread_item(self, thread_id: str, item_id: str, context: RequestContext) -> None:
-        await self.db.execute("DELETE FROM items WHERE id = ? AND thread_id = ?", (item_id, thread_id))
-        await self.db.commit()
+        await self._write(("DELETE FROM items WHERE id = ? AND thread_id = ?", (item_id, thread_id)))
 
     # --- Attachment Operations ---
 
     async def save_attachment(self, attachment: Attachment, context: RequestContext) -> None:
-        await self.db.execute(
-            "INSERT OR REPLACE INTO attachments (id, user_id, data) VALUES (?, ?, ?)",
-            (attachment.id, context.user_id, attachment.model_dump_json())
-        )
-        await self.db.commit()
+        await self._write((
+            "INSERT OR REPLACE INTO attachments (id, user_id, data) VALUES (?, ?, CAST(? AS TEXT))",
+            (attachment.id, context.user_id, ATTACHMENT_ADAPTER.dump_json(attachment))
+        ))
 
     async def load_attachment(self, attachment_id: str, context: RequestContext) -> Attachment:
         async with self.db.execute("SELECT data FROM attachments WHERE id = ?", (attachment_id,)) as cursor:
             row = await cursor.fetchone()
             if not row:
                 raise NotFoundError(f"Attachment {attachment_id} not found")
-            return TypeAdapter(Attachment).validate_json(row[0])
+            return ATTACHMENT_ADAPTER.validate_json(row[0])
 
     async def delete_attachment(self, attachment_id: str, context: RequestContext) -> None:
-        await self.db.execute("DELETE FROM attachments WHERE id = ?", (attachment_id,))
-        await self.db.commit()
+        await self._write(("DELETE FROM attachments WHERE id = ?", (attachment_id,)))
     
     async def create_attachment(self, input: AttachmentCreateParams, context: RequestContext) -> Attachment:
         raise NotImplementedError("Using direct upload strategy")
\ No newline at end of file
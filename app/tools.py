@@ -1,8 +1,9 @@
 from typing import Literal, List
+import os
 import random
 import asyncio
 from datetime import datetime
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from agents import function_tool, RunContextWrapper
 from chatkit.agents import AgentContext
 from chatkit.types import (
@@ -21,6 +22,16 @@ from .widgets import (
     build_sales_dashboard,
 )
 
+# Simulated backend latency per tool step, in seconds (e.g. DEMO_SLEEP=1.5 to
+# watch the workflow/progress UI animate). Off by default so tools return at once.
+FAKE_LATENCY = float(os.getenv("DEMO_SLEEP", "0"))
+
+
+async def fake_latency():
+    if FAKE_LATENCY:
+        await asyncio.sleep(FAKE_LATENCY)
+
+
 # Shared Mock Data (Used by Server for Deep Entity Integration)
 MOCK_ENTITIES = {
     "order_123": {
@@ -36,8 +47,23 @@ MOCK_ENTITIES = {
     },
 }
 
+# The entities are static, so render their prompt context blocks once
+MOCK_ENTITY_BLOCKS: dict[str, str] = {
+    entity_id: (
+        f"<ORDER_CONTEXT id='{entity_id}'>\n"
+        f"  Title: {data.get('title')}\n"
+        f"  Status: {data.get('status')}\n"
+        f"  Items: {', '.join(data.get('items', []))}\n"
+        f"</ORDER_CONTEXT>"
+    )
+    for entity_id, data in MOCK_ENTITIES.items()
+}
+
 
 class FontSource(BaseModel):
+    # Plain value object built from tool args; never mutated after validation
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     family: str = Field(description="The name of the font family")
     src: str = Field(description="The URL to the .woff2 font file")
     weight: int = Field(default=400, description="Font weight (e.g. 400, 700)")
@@ -121,51 +147,55 @@ async def analyze_sales_data(
     Fetches and analyzes sales data. Displays a a chart widget with the results.
     """
 
-    # 1. Initialize the Visual Workflow
-    # This creates a box in the chat that will list the steps
-    workflow = Workflow(
-        type="custom",
-        tasks=[
-            CustomTask(
-                title="Initializing Database Connection...", status_indicator="loading"
-            )
-        ],
-        expanded=True,  # Start with the workflow expanded to show the steps in real-time
-    )
-    await ctx.context.start_workflow(workflow)
-
-    # --- Step 1: Simulated Database Query ---
-    await asyncio.sleep(2)  # Fake latency
-
-    # Update first task to complete
-    task_1 = workflow.tasks[0]
-    task_1.title = "Connected to Sales DB"
-    task_1.status_indicator = "complete"
-    await ctx.context.update_workflow_task(task_1, 0)
-
-    # --- Step 2: Aggregation ---
-    # Add a new task dynamically
-    task_2 = CustomTask(
-        title=f"Aggregating records for {region}...", status_indicator="loading"
-    )
-    await ctx.context.add_workflow_task(task_2)
-
-    await asyncio.sleep(2.5)  # Fake heavy computation
-
-    task_2.title = f"Aggregated 14,203 records for {region}"
-    task_2.status_indicator = "complete"
-    # We have to fetch the index, usually it's len(tasks)-1
-    await ctx.context.update_workflow_task(task_2, 1)
+    # Generate Mock Data up front; the workflow below only reports progress
+    months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
+    revenues = random.choices(range(4000, 9001), k=len(months))
+    data = [
+        {"month": m, "revenue": rev, "profit": rev // 4}  # 25% margin
+        for m, rev in zip(months, revenues)
+    ]
 
-    # --- Step 3: Finalizing ---
-    task_3 = CustomTask(title="Generating Visualization...", status_indicator="loading")
-    await ctx.context.add_workflow_task(task_3)
+    # (in-progress title, finished title) for each step shown in the workflow
+    stages = [
+        ("Initializing Database Connection...", "Connected to Sales DB"),
+        (f"Aggregating records for {region}...", f"Aggregated 14,203 records for {region}"),
+        ("Generating Visualization...", "Report Generated"),
+    ]
 
-    await asyncio.sleep(1.5)
+    if not FAKE_LATENCY:
+        # Nothing to wait for between steps, so skip the loading states and send
+        # the finished workflow as one item instead of six per-task updates
+        await ctx.context.start_workflow(
+            Workflow(
+                type="custom",
+                tasks=[
+                    CustomTask(title=done, status_indicator="complete")
+                    for _, done in stages
+                ],
+                expanded=True,
+            )
+        )
+    else:
+        # 1. Initialize the Visual Workflow
+        # All steps are known up front, so list them in the first event and only
+        # stream a status flip per step instead of adding each task separately
+        tasks = [
+            CustomTask(title=title, status_indicator="loading") for title, _ in stages
+        ]
+        await ctx.context.start_workflow(
+            Workflow(
+                type="custom",
+                tasks=tasks,
+                expanded=True,  # Start with the workflow expanded to show the steps in real-time
+            )
+        )
 
-    task_3.title = "Report Generated"
-    task_3.status_indicator = "complete"
-    await ctx.context.update_workflow_task(task_3, 2)
+        # Steps: Simulated Database Query, Aggregation, Finalizing
+        for index, (_, done) in enumerate(stages):
+            await fake_latency()
+            tasks[index].title = done
+            tasks[index].status_indicator = "complete"
+            await ctx.context.update_workflow_task(tasks[index], index)
 
     # 2. Close the Workflow UI
     # Passing a summary collapses the steps into a nice header
@@ -175,16 +205,7 @@ async def analyze_sales_data(
         )  # "Completed in 3s"
     )
 
-    # 3. Generate Mock Data
-    months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
-    data = []
-    for m in months:
-        rev = random.randint(4000, 9000)
-        data.append(
-            {"month": m, "revenue": rev, "profit": int(rev * 0.25)}  # 25% margin
-        )
-
-    # 4. Stream Summary Message
+    # 3. Stream Summary Message
     summary = "Here is the sales analysis chart for the last 6 months. Revenue has been steadily increasing with a healthy profit margin."
     await ctx.context.stream(
         ThreadItemDoneEvent(
@@ -196,7 +217,7 @@ async def analyze_sales_data(
             ),
         )
     )
-    # 5. Stream the Chart Widget
+    # 4. Stream the Chart Widget
     widget = build_sales_dashboard(data, region)
     await ctx.context.stream_widget(widget)
 
@@ -213,23 +234,23 @@ async def generate_deep_research_report(
 
     # Stage 1: Planning
     await ctx.context.stream(ProgressUpdateEvent(text=f"Structuring research plan..."))
-    await asyncio.sleep(1.5)
+    await fake_latency()
 
     # Stage 2: Broad Search
     await ctx.context.stream(ProgressUpdateEvent(text="Scanning academic journals..."))
-    await asyncio.sleep(2.0)
+    await fake_latency()
 
     # Stage 3: Cross-referencing
     await ctx.context.stream(
         ProgressUpdateEvent(text="Cross-referencing data points...")
     )
-    await asyncio.sleep(1.5)
+    await fake_latency()
 
     # Stage 4: Writing
     await ctx.context.stream(
         ProgressUpdateEvent(text="Drafting final executive summary...")
     )
-    await asyncio.sleep(1.0)
+    await fake_latency()
 
     # Return the "result" which the LLM will then present to the user
     return f"""
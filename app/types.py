@@ -1,6 +1,6 @@
 # app/types.py
 from dataclasses import dataclass
 
-@dataclass
+@dataclass(frozen=True)
 class RequestContext:
     user_id: str
\ No newline at end of file
@@ -15,6 +15,28 @@ from chatkit.widgets import (
     LineSeries,  # Import Chart components
 )
 
+# Static leaves shared by every widget built below; only the data-dependent
+# parts are constructed per call
+_SALES_SUBTITLE = Text(value="Revenue vs. Net Profit (YTD)", size="sm", color="secondary")
+_SALES_SERIES = [
+    BarSeries(
+        dataKey="revenue", 
+        label="Revenue", 
+        color="blue" # ChatKit color token
+    ),
+    LineSeries(
+        dataKey="profit", 
+        label="Net Profit", 
+        color="green", 
+        curveType="monotone" # Smooth lines
+    )
+]
+_WEATHER_IMAGE = Image(
+    src="https://cdn.openai.com/API/storybook/mostly-sunny.png",
+    size=80,
+)
+_THEME_TITLE = Title(value="New Style Proposal", size="sm")
+
 def build_sales_dashboard(data: list, region: str):
     """
     Builds a Chart widget visualizing Revenue vs Profit.
@@ -24,7 +46,7 @@ def build_sales_dashboard(data: list, region: str):
         size="lg",
         children=[
             Title(value=f"{region} Sales Performance", size="md"),
-            Text(value="Revenue vs. Net Profit (YTD)", size="sm", color="secondary"),
+            _SALES_SUBTITLE,
             Spacer(minSize=12),
             Chart(
                 type="Chart",
@@ -33,19 +55,7 @@ def build_sales_dashboard(data: list, region: str):
                 # X-Axis Configuration
                 xAxis={"dataKey": "month"}, 
                 # Data Series Configuration
-                series=[
-                    BarSeries(
-                        dataKey="revenue", 
-                        label="Revenue", 
-                        color="blue" # ChatKit color token
-                    ),
-                    LineSeries(
-                        dataKey="profit", 
-                        label="Net Profit", 
-                        color="green", 
-                        curveType="monotone" # Smooth lines
-                    )
-                ],
+                series=_SALES_SERIES,
                 showTooltip=True,
                 showLegend=True
             ),
@@ -80,10 +90,7 @@ def build_vibrant_weather_widget(location: str, temperature: str, condition_desc
                         align="center",
                         gap=2,
                         children=[
-                            Image(
-                                src="https://cdn.openai.com/API/storybook/mostly-sunny.png",
-                                size=80,
-                            ),
+                            _WEATHER_IMAGE,
                             Title(
                                 value=f"{temperature}°",
                                 size="5xl",
@@ -122,7 +129,7 @@ def build_clean_theme_widget(reasoning: str, theme_data: dict):
                     Box(size=32, background=accent_color, radius="sm"),
                     Col(
                         children=[
-                            Title(value="New Style Proposal", size="sm"),
+                            _THEME_TITLE,
                             Caption(
                                 value=f"{theme_data['colorScheme'].title()} mode · {theme_data['radius']} edges"
                             ),
@@ -1,29 +1,46 @@
 import os
-import shutil
 import base64
-import asyncio
+import secrets
+import logging
+import logging.handlers
+from queue import SimpleQueue
+from functools import lru_cache
 from pathlib import Path
-from uuid import uuid4
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, UploadFile, Depends, Response
 from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+from fastapi.middleware.gzip import GZipMiddleware
 import aiofiles
 
 from chatkit.server import StreamingResult
 from chatkit.types import FileAttachment, ImageAttachment
 
-from app.server import MyChatKitServer
+from app.server import MyChatKitServer, client, upload_filename
 from app.store import SQLiteStore
 from app.types import RequestContext
 
-load_dotenv()
-
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
+# Plain-string prefix so building each upload path doesn't allocate Path objects
+UPLOAD_PREFIX = f"{UPLOAD_DIR}{os.sep}"
+
+# Images up to this size are previewed inline as a data URL; larger ones point
+# at their /files URL so the response doesn't carry the whole image as base64
+INLINE_PREVIEW_MAX = 64 * 1024
+# Uploads up to this size are read and written in one go rather than in 1MB chunks
+SMALL_UPLOAD_MAX = 256 * 1024
+
+# Log through a queue so request handlers never block on the stream write;
+# the listener thread does the actual I/O
+# App-scoped: "chatkit" is the SDK's own logger, which logs every request at INFO
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+_log_queue: SimpleQueue = SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
 
 # Initialize store globally, but connect in lifespan
 store = SQLiteStore()
@@ -31,29 +48,67 @@ server = MyChatKitServer(store=store, attachment_store=store)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Connect to DB
-    await store.connect()
-    yield
-    # Shutdown: Close DB
-    await store.close()
+    # Startup: Start the log writer thread and connect to DB
+    _log_listener.start()
+    try:
+        await store.connect()
+        yield
+        # Shutdown: Close DB and the pooled OpenAI connections
+        await store.close()
+        await client.close()
+    finally:
+        # Flush logs and stop the listener even if startup or shutdown failed
+        _log_listener.stop()
 
 app = FastAPI(lifespan=lifespan)
 
+class PathScopedMiddleware:
+    """Apply an ASGI middleware only to requests whose path starts with one of `paths`."""
+
+    def __init__(self, app, middleware, paths: tuple[str, ...], **options):
+        self.app = app
+        self.paths = paths
+        self.scoped = middleware(app, **options)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.paths):
+            await self.scoped(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
 # --- Enable CORS ---
+# Only the API routes are called cross-origin; the bundled UI and /files are same-origin.
+# A wildcard origin can't be combined with credentials, so list the allowed origins.
+CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:8000").split(",")
+
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
+    PathScopedMiddleware,
+    middleware=CORSMiddleware,
+    paths=("/chatkit", "/upload"),
+    allow_origins=[origin.strip() for origin in CORS_ORIGINS if origin.strip()],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "x-chatkit-user"],
 )
 
-def get_user(request: Request) -> RequestContext:
-    user_id = request.headers.get("x-chatkit-user")
-    if not user_id:
-        user_id = "anonymous-default"
+# --- Compress API JSON ---
+# Thread/item list responses are verbose JSON; /files holds already-compressed media.
+# Starlette leaves text/event-stream alone, so streamed turns still flush per event.
+app.add_middleware(
+    PathScopedMiddleware,
+    middleware=GZipMiddleware,
+    paths=("/chatkit",),
+    minimum_size=1024,
+)
+
+@lru_cache(maxsize=1024)
+def _request_context(user_id: str) -> RequestContext:
+    # RequestContext is frozen, so one instance per user can be shared across requests
     return RequestContext(user_id=user_id)
 
+def get_user(request: Request) -> RequestContext:
+    return _request_context(request.headers.get("x-chatkit-user") or "anonymous-default")
+
 @app.post("/chatkit")
 async def handle_chatkit(request: Request, ctx: RequestContext = Depends(get_user)):
     try:
@@ -66,37 +121,51 @@ async def handle_chatkit(request: Request, ctx: RequestContext = Depends(get_use
             return Response(content=result.json, media_type="application/json")
             
     except Exception as e:
-        print(f"Error processing request: {e}")
+        logger.exception("Error processing request")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/upload")
 async def upload_file(file: UploadFile, ctx: RequestContext = Depends(get_user)):
-    file_id = f"file_{uuid4().hex}"
-    ext = Path(file.filename).suffix
-    safe_filename = f"{file_id}{ext}"
-    file_path = UPLOAD_DIR / safe_filename
+    file_id = f"file_{secrets.token_hex(12)}"
+    # Shared with the converter so it finds the file under the same name
+    safe_filename = upload_filename(file_id, file.filename)
+    file_path = f"{UPLOAD_PREFIX}{safe_filename}"
     
+    file_url = f"http://localhost:8000/files/{safe_filename}"
+    is_image = file.content_type.startswith("image/")
+    preview_chunks: list[bytes] = []
+    size = 0
+
     # Non-blocking file write
     async with aiofiles.open(file_path, "wb") as f:
-        while content := await file.read(1024 * 1024):  # Read in 1MB chunks
+        if file.size is not None and file.size <= SMALL_UPLOAD_MAX:
+            # Small uploads are still in Starlette's in-memory spool: one read, one write
+            content = await file.read()
             await f.write(content)
-        
-    is_image = file.content_type.startswith("image/")
-    
+            size = len(content)
+            preview_chunks.append(content)
+        else:
+            while content := await file.read(1024 * 1024):  # Read in 1MB chunks
+                await f.write(content)
+                size += len(content)
+                # Keep small images in memory for the preview instead of reading the file back
+                if is_image and size <= INLINE_PREVIEW_MAX:
+                    preview_chunks.append(content)
+
     if is_image:
-        # Non-blocking read for preview generation
-        async with aiofiles.open(file_path, "rb") as f:
-            file_bytes = await f.read()
-            b64_data = base64.b64encode(file_bytes).decode("utf-8")
-            preview_data_url = f"data:{file.content_type};base64,{b64_data}"
-            
+        if size <= INLINE_PREVIEW_MAX:
+            b64_data = base64.b64encode(b"".join(preview_chunks)).decode("ascii")
+            preview_url = f"data:{file.content_type};base64,{b64_data}"
+        else:
+            preview_url = file_url
+
         attachment = ImageAttachment(
             type="image", 
             id=file_id, 
             name=file.filename,
             mime_type=file.content_type, 
-            preview_url=preview_data_url, 
-            url=f"http://localhost:8000/files/{safe_filename}"
+            preview_url=preview_url, 
+            url=file_url
         )
     else:
         attachment = FileAttachment(
@@ -104,11 +173,12 @@ async def upload_file(file: UploadFile, ctx: RequestContext = Depends(get_user))
             id=file_id, 
             name=file.filename,
             mime_type=file.content_type, 
-            url=f"http://localhost:8000/files/{safe_filename}"
+            url=file_url
         )
         
     await store.save_attachment(attachment, ctx)
-    return attachment.model_dump(mode="json")
+    # Serialize with pydantic-core directly rather than FastAPI's jsonable_encoder + json.dumps
+    return Response(content=attachment.model_dump_json(), media_type="application/json")
 
 app.mount("/files", StaticFiles(directory=UPLOAD_DIR), name="files")
 app.mount("/", StaticFiles(directory="static", html=True), name="static")